@@ -1,39 +1,602 @@
 import os
+import sys
+import argparse
 import curses
+import errno
+import hashlib
+import heapq
 import json
+import queue
+import random
+import threading
 import time
+from array import array
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 # --- Configuration ---
 BLOCK_SIZE = 16 * 1024  # 16KB
 MAX_BLOCKS = 16  # 256KB total
 
-# SAVE STATE FILE FOR SELECTIONS
+# ROM LIBRARY LOCATIONS
+MACHINES_DIR = "systemroms/machines"
+EXTRAS_DIR = "extras"
+
+# SAVE STATE FOR SELECTIONS: one JSON file per named profile
+PROFILES_DIR = "omega_profiles"
+DEFAULT_PROFILE = "default"
+# Single-file save state from older versions, imported into the default profile
 SELECTIONS_FILE = "omega_rom_selections.json"
 
+# HASH CACHE FOR DUPLICATE DETECTION (kept between sessions)
+HASH_CACHE_FILE = "omega_rom_hashes.json"
+PARTIAL_HASH_SIZE = 4 * 1024  # Bytes hashed before committing to a full hash
+
+# --- Output Formats ---
+# Any combination of the keys in OUTPUT_ENCODERS ("bin", "hex", "srec", "split")
+OUTPUT_FORMATS = ["bin"]
+RECORD_SIZE = 32  # Data bytes per Intel HEX / S-record line
+OUTPUT_BUFFER_SIZE = 8 * 1024  # Write buffer used while streaming output files
+SLOT_NAMES = ["slot0", "slot3-0", "slot3-1", "slot3-3"]
+
+# --- File I/O ---
+IO_WORKERS = 8  # Concurrent stats/reads; also used for background prefetch
+IO_TIMEOUT = 10.0  # Seconds one attempt may run before it is given up on
+IO_RETRIES = 2  # Extra attempts after a failed or timed-out one
+IO_RETRY_DELAY = 0.2  # Seconds before the first retry, doubled for each next one
+
 
 # --- Patch Selections ---
 # These are defaults; can be toggled in the UI
 APPLY_INT_KEYBOARD_PATCH = True
 APPLY_BACKSLASH_PATCH = True
+INT_KEYBOARD_PATCH_FILE = "patches/int_keys_patch.bin"
+BACKSLASH_PATCH_FILE = "patches/backslash_patch.bin"
+
+
+# --- File I/O Layer ---
+# Stats, directory listings and reads go through io_fs and run on a shared
+# thread pool, so high-latency storage is accessed concurrently.
+class LocalFS:
+    def stat(self, path):
+        return os.stat(path)
+
+    def scandir(self, path):
+        # (name, is_dir, size) per entry, where size is None for directories
+        # and the OSError for files that cannot be stat'ed. Symlinked
+        # directories are left out, as os.walk does not descend into them.
+        entries = []
+        with os.scandir(path) as it:
+            for e in it:
+                if e.is_dir():
+                    if not e.is_symlink():
+                        entries.append((e.name, True, None))
+                    continue
+                try:
+                    size = e.stat().st_size
+                except OSError as error:
+                    size = error
+                entries.append((e.name, False, size))
+        return entries
+
+    def read(self, path, nbytes=None):
+        with open(path, "rb") as f:
+            return f.read() if nbytes is None else f.read(nbytes)
+
+
+class LatencyFS(LocalFS):
+    # LocalFS with a simulated network round trip (and optional random
+    # failures) on every call, to measure concurrency and retries offline
+
+    def __init__(self, latency, jitter=0.0, failure_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+
+    def _round_trip(self):
+        time.sleep(self.latency + random.uniform(0, self.jitter))
+        if random.random() < self.failure_rate:
+            raise OSError(errno.EIO, "Injected I/O error")
+
+    def stat(self, path):
+        self._round_trip()
+        return super().stat(path)
+
+    def scandir(self, path):
+        self._round_trip()
+        return super().scandir(path)
+
+    def read(self, path, nbytes=None):
+        self._round_trip()
+        return super().read(path, nbytes)
+
+
+io_fs = LocalFS()
+_io_pool = None
+_io_hung = 0  # Timed-out calls still holding a worker of _io_pool
+_io_lock = threading.Lock()
+
+
+class FileAccessError(Exception):
+    def __init__(self, path, attempts, cause):
+        self.path = path
+        self.attempts = attempts
+        self.cause = cause
+        reason = getattr(cause, "strerror", None) or str(cause)
+        tries = "attempt" if attempts == 1 else "attempts"
+        super().__init__(f"{path}: {reason} (after {attempts} {tries})")
+
+
+class RomBuildError(Exception):
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(f"{len(errors)} selected file(s) could not be read")
+
+
+def _get_io_pool():
+    global _io_pool
+    if _io_pool is None:
+        _io_pool = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="io")
+    return _io_pool
+
+
+def set_io_workers(workers):
+    global IO_WORKERS, _io_pool, _io_hung
+    IO_WORKERS = workers
+    if _io_pool is not None:
+        _io_pool.shutdown(wait=False)
+        _io_pool = None
+        _io_hung = 0
+
+
+def _replace_io_pool():
+    # Hung calls cannot be interrupted, so their threads are left behind with
+    # the old pool; work still queued there is cancelled
+    global _io_pool, _io_hung
+    with _io_lock:
+        old, _io_pool, _io_hung = _io_pool, None, 0
+    if old is not None:
+        old.shutdown(wait=False, cancel_futures=True)
+    return _get_io_pool()
+
+
+def _mark_hung(future):
+    # Count a timed-out call against the pool until its worker returns
+    global _io_hung
+    pool = _io_pool
+    with _io_lock:
+        _io_hung += 1
+
+    def release(_):
+        global _io_hung
+        with _io_lock:
+            if _io_pool is pool:
+                _io_hung -= 1
+
+    future.add_done_callback(release)
+
+
+def _retryable(error):
+    return not isinstance(
+        error,
+        (FileNotFoundError, NotADirectoryError, IsADirectoryError, PermissionError),
+    )
+
+
+def _timed_call(events, token, func, args):
+    events.put(("start", token, time.monotonic()))
+    return func(*args)
+
+
+def io_map(func, args_list):
+    # Run func(*args) for every args tuple on the I/O pool. Each attempt gets
+    # IO_TIMEOUT seconds from the moment a worker starts it; failed or timed
+    # out calls are retried up to IO_RETRIES times with a growing delay.
+    # Timed-out calls keep their worker busy, so they count against
+    # IO_WORKERS until they return; if queued work cannot start within
+    # IO_TIMEOUT the pool is clogged by hung calls and is replaced.
+    # Results are returned in order, with a FileAccessError for each failure.
+    results = [None] * len(args_list)
+    attempts = [0] * len(args_list)
+    running = {}  # token -> [index, future, start time or None]
+    deadlines = []  # heap of (deadline, token, started)
+    retry_at = []  # heap of (time, index)
+    events = queue.SimpleQueue()
+    next_item = 0
+    next_token = 0
+
+    def submit(i, new_attempt=True):
+        nonlocal next_token
+        if new_attempt:
+            attempts[i] += 1
+        token = next_token
+        next_token += 1
+        future = _get_io_pool().submit(
+            _timed_call, events, token, func, args_list[i]
+        )
+        running[token] = [i, future, None]
+        heapq.heappush(deadlines, (time.monotonic() + IO_TIMEOUT, token, False))
+        future.add_done_callback(lambda f, t=token: events.put(("done", t)))
+
+    def failed(i, error, now):
+        if attempts[i] <= IO_RETRIES and _retryable(error):
+            delay = IO_RETRY_DELAY * 2 ** (attempts[i] - 1)
+            heapq.heappush(retry_at, (now + delay, i))
+        else:
+            results[i] = FileAccessError(args_list[i][0], attempts[i], error)
+
+    def requeue_waiting():
+        # Move attempts that never started over to a fresh pool
+        _replace_io_pool()
+        for token, (i, _, started) in list(running.items()):
+            if started is None:
+                del running[token]
+                submit(i, new_attempt=False)
+
+    while True:
+        now = time.monotonic()
+        while len(running) < IO_WORKERS - _io_hung:
+            if retry_at and retry_at[0][0] <= now:
+                submit(heapq.heappop(retry_at)[1])
+            elif next_item < len(args_list):
+                submit(next_item)
+                next_item += 1
+            else:
+                break
+        if not running:
+            if not retry_at and next_item >= len(args_list):
+                break
+            if _io_hung >= IO_WORKERS:
+                # Every worker is stuck in a hung call
+                _replace_io_pool()
+                continue
+        # Drop heap entries of attempts that finished or have since started
+        while deadlines:
+            _, token, started = deadlines[0]
+            entry = running.get(token)
+            if entry is None or (not started and entry[2] is not None):
+                heapq.heappop(deadlines)
+            else:
+                break
+        wake = deadlines[0][0] if deadlines else now + IO_TIMEOUT
+        if retry_at:
+            wake = min(wake, retry_at[0][0])
+        batch = []
+        try:
+            batch.append(events.get(timeout=max(0.0, wake - now)))
+            while True:
+                batch.append(events.get_nowait())
+        except queue.Empty:
+            pass
+        now = time.monotonic()
+        for event in batch:
+            entry = running.get(event[1])
+            if entry is None:
+                continue  # Late event of an attempt that was given up on
+            if event[0] == "start":
+                entry[2] = event[2]
+                heapq.heappush(deadlines, (event[2] + IO_TIMEOUT, event[1], True))
+                continue
+            del running[event[1]]
+            i, future, _ = entry
+            if future.cancelled():
+                # Queued work dropped by a pool replacement elsewhere
+                submit(i, new_attempt=False)
+                continue
+            error = future.exception()
+            if error is None:
+                results[i] = future.result()
+            else:
+                failed(i, error, now)
+        clogged = False
+        while deadlines and deadlines[0][0] <= now:
+            _, token, started = heapq.heappop(deadlines)
+            entry = running.get(token)
+            if entry is None:
+                continue
+            if started:
+                # The worker cannot be interrupted; its late result is ignored
+                del running[token]
+                _mark_hung(entry[1])
+                failed(
+                    entry[0], TimeoutError(f"No response after {IO_TIMEOUT:g}s"), now
+                )
+            elif entry[2] is None:
+                clogged = True
+        if clogged:
+            requeue_waiting()
+    return results
+
+
+def stat_many(paths):
+    # One stat per distinct path; None for paths that cannot be stat'ed
+    paths = list(set(paths))
+    results = io_map(io_fs.stat, [(path,) for path in paths])
+    return {
+        path: None if isinstance(st, FileAccessError) else st
+        for path, st in zip(paths, results)
+    }
+
+
+# --- Catalog Categories ---
+# Bit flags derived once per file from its basename (and library root)
+CAT_BIOS = 1 << 0
+CAT_LOGO = 1 << 1
+CAT_SUB = 1 << 2
+CAT_KANJI = 1 << 3
+CAT_EXT = 1 << 4
+CAT_MSXD = 1 << 5
+CAT_DISK = 1 << 6
+CAT_KUN = 1 << 7
+CAT_FM = 1 << 8
+CAT_MUSIC = 1 << 9
+CAT_EXTRAS = 1 << 10  # File lives under EXTRAS_DIR
+CATEGORY_KEYWORDS = [
+    ("bios", CAT_BIOS),
+    ("logo", CAT_LOGO),
+    ("sub", CAT_SUB),
+    ("kanji", CAT_KANJI),
+    ("ext", CAT_EXT),
+    ("msxd", CAT_MSXD),
+    ("disk", CAT_DISK),
+    ("kun", CAT_KUN),
+    ("fm", CAT_FM),
+    ("music", CAT_MUSIC),
+]
+
+# Picker filter per slot: (categories to include, categories to exclude)
+SLOT_FILTERS = [
+    (CAT_BIOS | CAT_LOGO, CAT_EXTRAS),  # SLOT 0
+    (CAT_SUB | CAT_KANJI | CAT_EXT | CAT_MSXD, 0),  # SLOT 3-0
+    (CAT_DISK, CAT_EXTRAS),  # SLOT 3-1
+    (CAT_KUN | CAT_FM | CAT_MUSIC, CAT_EXTRAS),  # SLOT 3-3
+]
+
+
+def category_flags(name):
+    name = name.lower()
+    flags = 0
+    for keyword, flag in CATEGORY_KEYWORDS:
+        if keyword in name:
+            flags |= flag
+    return flags
 
 
 # --- File Picker ---
+class RomCatalog:
+    # Column-oriented file list: one interned directory table, and per file a
+    # directory id, an interned basename, its size and its category flags.
+    # Full paths and display names are only built when asked for.
+
+    def __init__(self):
+        self.dirs = []
+        self.dir_labels = []  # Last directory component shown in the picker
+        self._dir_index = {}
+        self.dir_ids = array("I")
+        self.names = []
+        self.sizes = array("Q")
+        self.flags = array("H")
+        self.errors = []  # FileAccessError per unreadable directory or file
+
+    def __len__(self):
+        return len(self.names)
+
+    def add_dir(self, path):
+        dir_id = self._dir_index.get(path)
+        if dir_id is None:
+            dir_id = len(self.dirs)
+            self._dir_index[path] = dir_id
+            self.dirs.append(sys.intern(path))
+            label = os.path.basename(path)
+            self.dir_labels.append(
+                sys.intern(label) if label and label != "." else ""
+            )
+        return dir_id
+
+    def add(self, dir_id, name, size, flags):
+        self.dir_ids.append(dir_id)
+        self.names.append(sys.intern(name))
+        self.sizes.append(size)
+        self.flags.append(flags | category_flags(name))
+
+    def sort(self):
+        # Order entries by full path, then rebuild the columns in that order
+        order = sorted(range(len(self)), key=self.path)
+        self.dir_ids = array("I", (self.dir_ids[i] for i in order))
+        self.names = [self.names[i] for i in order]
+        self.sizes = array("Q", (self.sizes[i] for i in order))
+        self.flags = array("H", (self.flags[i] for i in order))
+
+    def path(self, i):
+        return os.path.join(self.dirs[self.dir_ids[i]], self.names[i])
+
+    def display_name(self, i):
+        # Show last directory and filename
+        label = self.dir_labels[self.dir_ids[i]]
+        return f"{label}/{self.names[i]}" if label else self.names[i]
+
+    def select(self, include, exclude=0):
+        flags = self.flags
+        return array(
+            "I",
+            (
+                i
+                for i in range(len(flags))
+                if flags[i] & include and not flags[i] & exclude
+            ),
+        )
+
+    def memory_usage(self):
+        # Bytes held by the catalog, counting each interned string once
+        total = sum(
+            sys.getsizeof(col)
+            for col in (
+                self.dirs,
+                self.dir_labels,
+                self._dir_index,
+                self.dir_ids,
+                self.names,
+                self.sizes,
+                self.flags,
+            )
+        )
+        seen = set()
+        for text in self.dirs + self.dir_labels + self.names:
+            if id(text) not in seen:
+                seen.add(id(text))
+                total += sys.getsizeof(text)
+        return total
+
+    def bytes_per_entry(self):
+        return self.memory_usage() / len(self) if len(self) else 0
+
+
 def list_all_files(dirs):
-    file_list = []
-    for directory in dirs:
-        for root, _, files in os.walk(directory):
-            for f in files:
-                rel_dir = os.path.relpath(root, directory)
-                rel_file = (
-                    os.path.join(directory, rel_dir, f)
-                    if rel_dir != "."
-                    else os.path.join(directory, f)
-                )
-                file_list.append(rel_file)
-    return sorted(file_list)
+    # Directories are listed one tree level at a time, each level spread
+    # over the I/O pool; a listing includes the size of every file in it
+    catalog = RomCatalog()
+    level = [(d, CAT_EXTRAS if d == EXTRAS_DIR else 0) for d in dirs]
+    while level:
+        listings = io_map(io_fs.scandir, [(path,) for path, _ in level])
+        next_level = []
+        for (path, flags), listing in zip(level, listings):
+            if isinstance(listing, FileAccessError):
+                # A library root that does not exist is simply not used
+                if path not in dirs or not isinstance(
+                    listing.cause, FileNotFoundError
+                ):
+                    catalog.errors.append(listing)
+                continue
+            dir_id = catalog.add_dir(path)
+            for name, is_dir, size in listing:
+                if is_dir:
+                    next_level.append((os.path.join(path, name), flags))
+                else:
+                    if not isinstance(size, int):
+                        catalog.errors.append(
+                            FileAccessError(os.path.join(path, name), 1, size)
+                        )
+                        size = 0
+                    catalog.add(dir_id, name, size, flags)
+        level = next_level
+    catalog.sort()
+    return catalog
+
+
+# --- Duplicate Detection ---
+def load_hash_cache():
+    if os.path.exists(HASH_CACHE_FILE):
+        try:
+            with open(HASH_CACHE_FILE, "r") as f:
+                return json.load(f)
+        except Exception:
+            pass
+    return {}
+
+
+def save_hash_cache(cache, checked=()):
+    # Entries for paths in checked were just stat'ed by the caller; stat the
+    # rest so files that are gone drop out instead of piling up
+    checked = set(checked)
+    others = [path for path in cache if path not in checked]
+    for path, st in stat_many(others).items():
+        if st is None:
+            del cache[path]
+    _write_json_atomic(HASH_CACHE_FILE, cache, indent=None)
+
+
+def _digest_file(path, nbytes=None):
+    # Runs on the I/O pool, so only the digest is kept in memory per file
+    return hashlib.sha1(io_fs.read(path, nbytes)).hexdigest()
+
+
+def hash_file(path, nbytes=None):
+    digest = io_map(_digest_file, [(path, nbytes)])[0]
+    if isinstance(digest, FileAccessError):
+        raise digest
+    return digest
+
+
+def _cached_digests(paths, stats, cache, kind, nbytes=None):
+    # Digest per path, reused from the cache while size and mtime still match
+    # the file; the rest are hashed concurrently. None for unreadable files.
+    digests = [None] * len(paths)
+    todo = []
+    for n, (path, st) in enumerate(zip(paths, stats)):
+        entry = cache.get(path)
+        if (
+            not entry
+            or entry.get("size") != st.st_size
+            or entry.get("mtime") != st.st_mtime_ns
+        ):
+            entry = {"size": st.st_size, "mtime": st.st_mtime_ns}
+            cache[path] = entry
+        if kind in entry:
+            digests[n] = entry[kind]
+        else:
+            todo.append(n)
+    hashed = io_map(_digest_file, [(paths[n], nbytes) for n in todo])
+    for n, digest in zip(todo, hashed):
+        if not isinstance(digest, FileAccessError):
+            cache[paths[n]][kind] = digest
+            digests[n] = digest
+    return digests
+
+
+def _split_by_digest(files, stats, candidates, cache, kind, nbytes=None):
+    # Regroup each candidate group by digest; unreadable files stand alone
+    flat = [i for group in candidates for i in group]
+    digests = _cached_digests(
+        [files[i] for i in flat], [stats[i] for i in flat], cache, kind, nbytes
+    )
+    digest_of = dict(zip(flat, digests))
+    split = []
+    for group in candidates:
+        by_digest = {}
+        for i in group:
+            if digest_of[i] is None:
+                split.append([i])
+            else:
+                by_digest.setdefault(digest_of[i], []).append(i)
+        split.extend(by_digest.values())
+    return split
 
 
-def select_file(stdscr, files, slot_name):
+def group_duplicate_files(files, cache):
+    # Group files with identical content. Returns lists of indices into files,
+    # ordered by first occurrence. Only files sharing a size get a partial hash,
+    # and only files sharing a partial hash get a full hash.
+    groups = []
+    by_size = {}
+    stats = {}
+    file_stats = stat_many(files)
+    for i, fname in enumerate(files):
+        st = file_stats[fname]
+        if st is None:
+            cache.pop(fname, None)
+            groups.append([i])
+            continue
+        stats[i] = st
+        by_size.setdefault(st.st_size, []).append(i)
+    candidates = []
+    for members in by_size.values():
+        (candidates if len(members) > 1 else groups).append(members)
+    full_candidates = []
+    for members in _split_by_digest(
+        files, stats, candidates, cache, "partial", PARTIAL_HASH_SIZE
+    ):
+        if len(members) == 1 or stats[members[0]].st_size <= PARTIAL_HASH_SIZE:
+            # Partial hash already covers the whole file
+            groups.append(members)
+        else:
+            full_candidates.append(members)
+    groups.extend(_split_by_digest(files, stats, full_candidates, cache, "full"))
+    groups.sort(key=lambda g: g[0])
+    return groups
+
+
+def select_file(stdscr, catalog, files, slot_name, persist=True):
+    # files: catalog indices to offer; returns the picked path or None.
+    # persist=False keeps the hash cache on disk untouched (used by --replay)
     curses.curs_set(0)
     selected = 0
     offset = 0
@@ -50,25 +613,65 @@ def select_file(stdscr, files, slot_name):
     search_buffer = ""
     last_key_time = 0
     SEARCH_TIMEOUT = 1.0
+    notice = None
+    footer = f" {len(files)} files, {catalog.bytes_per_entry():.0f} B/entry "
+    # Dedup view (TAB): one row per unique ROM, RIGHT/LEFT expands/collapses
+    # the list of locations sharing that content
+    dedup = False
+    groups = None
+    expanded = set()
+
+    def build_rows():
+        # Each row: (index into files, number of duplicates, is_location)
+        if not dedup:
+            return [(i, 0, False) for i in range(len(files))]
+        rows = []
+        for g, group in enumerate(groups):
+            rows.append((group[0], len(group) - 1, False))
+            if g in expanded:
+                rows.extend((i, 0, True) for i in group[1:])
+        return rows
+
+    def group_of(file_idx):
+        for g, group in enumerate(groups):
+            if file_idx in group:
+                return g
+        return None
+
+    rows = build_rows()
     while True:
         win.clear()
         win.box()
         title = f" Select {slot_name} "
         win.addstr(0, (win_width - len(title)) // 2, title, curses.A_BOLD)
+        if len(footer) < win_width - 4:
+            win.addstr(
+                win_height - 1, win_width - len(footer) - 2, footer, curses.A_DIM
+            )
         if search_buffer:
             win.addstr(1, 2, f"Search: {search_buffer}", curses.A_DIM)
-        for idx, fname in enumerate(files[offset : offset + max_display]):
+        elif notice:
+            win.addstr(1, 2, f"! {notice}"[: win_width - 4], curses.A_BOLD)
+        elif dedup:
+            win.addstr(
+                1, 2, f"Unique: {len(groups)} of {len(files)} [TAB]", curses.A_DIM
+            )
+        elif catalog.errors:
+            win.addstr(1, 2, f"! {catalog.errors[0]}"[: win_width - 4], curses.A_BOLD)
+        if catalog.errors:
+            unreadable = f" {len(catalog.errors)} unreadable "
+            win.addstr(win_height - 1, 2, unreadable, curses.A_BOLD)
+        for idx, (file_idx, dups, is_location) in enumerate(
+            rows[offset : offset + max_display]
+        ):
             y = idx + 2
-            # Show last directory and filename
-            dirpart = os.path.basename(os.path.dirname(fname))
-            if dirpart and dirpart != ".":
-                display_name = f"{dirpart}/{os.path.basename(fname)}"[:name_col]
-            else:
-                display_name = os.path.basename(fname)[:name_col]
-            try:
-                size_kb = os.path.getsize(fname) // 1024
-            except Exception:
-                size_kb = 0
+            display_name = catalog.display_name(files[file_idx])
+            if is_location:
+                display_name = f"  - {display_name}"
+            elif dups:
+                display_name = f"{display_name} (+{dups})"
+            display_name = display_name[:name_col]
+            size_kb = catalog.sizes[files[file_idx]] // 1024
             display_size = f"{size_kb} KB"
             line = f"{display_name:<{name_col}}  {display_size:>{size_col}}"
             if idx + offset == selected:
@@ -77,19 +680,54 @@ def select_file(stdscr, files, slot_name):
             if idx + offset == selected:
                 win.attroff(curses.color_pair(1))
         win.refresh()
-        key = win.getch()
+        key = read_key(win)
+        notice = None
         now = time.time()
         if search_buffer and now - last_key_time > SEARCH_TIMEOUT:
             search_buffer = ""
         last_key_time = now
         if key == curses.KEY_UP and selected > 0:
             selected -= 1
-        elif key == curses.KEY_DOWN and selected < len(files) - 1:
+        elif key == curses.KEY_DOWN and selected < len(rows) - 1:
             selected += 1
         elif key == ord("\n"):
-            return files[selected]
+            return catalog.path(files[rows[selected][0]]) if rows else None
         elif key == 27:
             return None
+        elif key == 9:  # TAB
+            current = rows[selected][0] if rows else None
+            if groups is None:
+                cache = load_hash_cache()
+                paths = [catalog.path(i) for i in files]
+                groups = group_duplicate_files(paths, cache)
+                if persist:
+                    try:
+                        save_hash_cache(cache, paths)
+                    except OSError as e:
+                        notice = f"Hash cache not saved: {e.strerror or e}"
+            dedup = not dedup
+            rows = build_rows()
+            selected = 0
+            if current is not None:
+                if dedup:
+                    current = groups[group_of(current)][0]
+                for r, row in enumerate(rows):
+                    if row[0] == current:
+                        selected = r
+                        break
+            search_buffer = ""
+        elif dedup and key in (curses.KEY_RIGHT, curses.KEY_LEFT) and rows:
+            g = group_of(rows[selected][0])
+            if key == curses.KEY_RIGHT:
+                expanded.add(g)
+            else:
+                expanded.discard(g)
+            rows = build_rows()
+            for r, row in enumerate(rows):
+                if row[0] == groups[g][0]:
+                    selected = r
+                    break
+            search_buffer = ""
         elif 32 <= key <= 126:
             ch = chr(key).lower()
             if len(search_buffer) < 5:
@@ -97,23 +735,15 @@ def select_file(stdscr, files, slot_name):
             else:
                 search_buffer = search_buffer[1:] + ch
             found = False
-            for i, fname in enumerate(files):
-                dirpart = os.path.basename(os.path.dirname(fname))
-                if dirpart and dirpart != ".":
-                    search_name = f"{dirpart}/{os.path.basename(fname)}"
-                else:
-                    search_name = os.path.basename(fname)
+            for i, (file_idx, _, _) in enumerate(rows):
+                search_name = catalog.display_name(files[file_idx])
                 if search_name.lower().startswith(search_buffer):
                     selected = i
                     found = True
                     break
             if not found:
-                for i, fname in enumerate(files):
-                    dirpart = os.path.basename(os.path.dirname(fname))
-                    if dirpart and dirpart != ".":
-                        search_name = f"{dirpart}/{os.path.basename(fname)}"
-                    else:
-                        search_name = os.path.basename(fname)
+                for i, (file_idx, _, _) in enumerate(rows):
+                    search_name = catalog.display_name(files[file_idx])
                     if search_name.lower().startswith(ch):
                         selected = i
                         break
@@ -125,27 +755,207 @@ def select_file(stdscr, files, slot_name):
             offset = selected - max_display + 1
 
 
-def save_selections(block_files, block_paths):
-    data = {
-        "block_files": block_files,
-        "block_paths": block_paths,
+# --- Block Prefetch ---
+# Selected files are read in the background while the UI is idle, so the
+# final build only assembles bytes that are already in memory.
+_block_cache = {}  # (path, nbytes) -> Future holding (stat, bytes read)
+
+
+def slot_read_size(block_idx):
+    # A file may fill the rest of its slot, starting at this block
+    return BLOCK_SIZE * (4 - (block_idx % 4))
+
+
+def _prefetch_read(path, nbytes=None):
+    # Stat first, so a change made while or after reading shows at build time
+    st = io_fs.stat(path)
+    return st, io_fs.read(path, nbytes)
+
+
+def prefetch_file(path, nbytes=None):
+    key = (path, nbytes)
+    if key not in _block_cache:
+        _block_cache[key] = _get_io_pool().submit(_prefetch_read, path, nbytes)
+
+
+def drop_prefetched(path, nbytes=None):
+    future = _block_cache.pop((path, nbytes), None)
+    if future is not None:
+        future.cancel()
+
+
+def read_many(requests):
+    # requests: (path, nbytes) pairs. Successful prefetches are used while
+    # the file's size and mtime are unchanged; everything else is read on
+    # the I/O pool with retries. Returns the data or a FileAccessError per
+    # request.
+    results = [None] * len(requests)
+    prefetched = {
+        n: _block_cache[key] for n, key in enumerate(requests) if key in _block_cache
+    }
+    wait(prefetched.values(), timeout=IO_TIMEOUT)
+    usable = {
+        n: future.result()
+        for n, future in prefetched.items()
+        if future.done() and not future.cancelled() and future.exception() is None
     }
-    with open(SELECTIONS_FILE, "w") as f:
-        json.dump(data, f)
+    stats = stat_many(requests[n][0] for n in usable)
+    missing = []
+    for n, (path, _) in enumerate(requests):
+        if n in usable:
+            old, data = usable[n]
+            st = stats[path]
+            if (
+                st is not None
+                and st.st_size == old.st_size
+                and st.st_mtime_ns == old.st_mtime_ns
+            ):
+                results[n] = data
+                continue
+        missing.append(n)
+    for n, data in zip(missing, io_map(io_fs.read, [requests[n] for n in missing])):
+        results[n] = data
+    return results
 
 
-def load_selections():
-    if os.path.exists(SELECTIONS_FILE):
+# --- Selection Profiles ---
+def profile_path(profile):
+    return os.path.join(PROFILES_DIR, f"{profile}.json")
+
+
+def list_profiles():
+    try:
+        names = os.listdir(PROFILES_DIR)
+    except Exception:
+        return []
+    return sorted(n[: -len(".json")] for n in names if n.endswith(".json"))
+
+
+def _write_json_atomic(path, data, indent=1):
+    # Write to a temporary file next to the target, then swap it into place
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, indent=indent)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def file_fingerprint(path, st, previous=None):
+    # Reuse the previous hash while size and mtime are unchanged
+    if (
+        previous
+        and previous.get("hash")
+        and previous.get("size") == st.st_size
+        and previous.get("mtime") == st.st_mtime_ns
+    ):
+        return {"size": st.st_size, "mtime": st.st_mtime_ns, "hash": previous["hash"]}
+    return {"size": st.st_size, "mtime": st.st_mtime_ns, "hash": hash_file(path)}
+
+
+def validate_selections(block_paths, stored):
+    # Check saved fingerprints against the files on disk. Returns the current
+    # fingerprint per path and a status per block: None, "missing" or "changed".
+    stats = stat_many(p for p in block_paths if p)
+    fingerprints = {}
+    status = [None] * 16
+    for i, path in enumerate(block_paths):
+        if not path:
+            continue
+        st = stats[path]
+        if st is None:
+            status[i] = "missing"
+            continue
+        previous = stored[i]
         try:
+            current = fingerprints.get(path) or file_fingerprint(path, st, previous)
+        except Exception:
+            status[i] = "missing"
+            continue
+        fingerprints[path] = current
+        if previous and previous.get("hash") and previous["hash"] != current["hash"]:
+            status[i] = "changed"
+    return fingerprints, status
+
+
+def save_selections(block_files, block_paths, profile=DEFAULT_PROFILE, known=None):
+    # known: fingerprints by path from validate_selections, to skip re-hashing
+    known = known if known is not None else {}
+    stats = stat_many(p for p in block_paths if p)
+    slots = []
+    for fname, fpath in zip(block_files, block_paths):
+        if not (fname and fpath):
+            slots.append(None)
+            continue
+        slot = {"file": fname, "path": fpath}
+        if stats[fpath] is not None:
+            try:
+                known[fpath] = file_fingerprint(fpath, stats[fpath], known.get(fpath))
+                slot.update(known[fpath])
+            except Exception:
+                pass
+        slots.append(slot)
+    os.makedirs(PROFILES_DIR, exist_ok=True)
+    _write_json_atomic(profile_path(profile), {"version": 1, "slots": slots})
+
+
+def _clean_slot(slot):
+    # Keep only well-formed fields of a saved slot; a slot without a usable
+    # path is treated as empty
+    if not isinstance(slot, dict):
+        return None
+    path = slot.get("path")
+    if not isinstance(path, str) or not path:
+        return None
+    fname = slot.get("file")
+    clean = {
+        "file": fname if isinstance(fname, str) and fname else os.path.basename(path),
+        "path": path,
+    }
+    for key, kind in (("size", int), ("mtime", int), ("hash", str)):
+        if isinstance(slot.get(key), kind):
+            clean[key] = slot[key]
+    return clean
+
+
+def load_selections(profile=DEFAULT_PROFILE):
+    # Returns (block_files, block_paths, fingerprints, status), or all None
+    # if the profile does not exist or cannot be read
+    path = profile_path(profile)
+    slots = None
+    try:
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                slots = json.load(f).get("slots")
+        elif profile == DEFAULT_PROFILE and os.path.exists(SELECTIONS_FILE):
             with open(SELECTIONS_FILE, "r") as f:
                 data = json.load(f)
-            return data.get("block_files", []), data.get("block_paths", [])
-        except Exception:
-            pass
-    return None, None
+            slots = [
+                {"file": fname, "path": fpath} if fname and fpath else None
+                for fname, fpath in zip(
+                    data.get("block_files", []), data.get("block_paths", [])
+                )
+            ]
+    except Exception:
+        pass
+    if not isinstance(slots, list) or len(slots) != 16:
+        return None, None, None, None
+    slots = [_clean_slot(slot) for slot in slots]
+    block_files = [slot["file"] if slot else None for slot in slots]
+    block_paths = [slot["path"] if slot else None for slot in slots]
+    fingerprints, status = validate_selections(block_paths, slots)
+    return block_files, block_paths, fingerprints, status
 
 
-def pick_files():
+def pick_files(profile=DEFAULT_PROFILE, persist=True):
+    # persist=False leaves profiles on disk untouched (used by --replay)
     # Each slot block: (slot_name, block_index)
     slot_blocks = (
         [("SLOT 0", i) for i in range(4)]
@@ -153,21 +963,55 @@ def pick_files():
         + [("SLOT 3-1", i) for i in range(4)]
         + [("SLOT 3-3", i) for i in range(4)]
     )
-    block_files, block_paths = load_selections()
-    if (
-        not block_files
-        or not block_paths
-        or len(block_files) != 16
-        or len(block_paths) != 16
-    ):
-        block_files = [None] * 16
-        block_paths = [None] * 16
+    block_files = [None] * 16
+    block_paths = [None] * 16
+    block_status = [None] * 16  # "missing" / "changed" for stale selections
+    block_sizes = [0] * 16  # Stat'ed once per change, not on every redraw
+    fingerprints = {}
+    prefetch_file(INT_KEYBOARD_PATCH_FILE)
+    prefetch_file(BACKSLASH_PATCH_FILE)
+
+    def set_block(block_idx, path, size=None):
+        # Replace a block selection, keeping the block cache and size in step
+        if path and size is None:
+            st = stat_many([path])[path]
+            size = st.st_size if st else 0
+        block_sizes[block_idx] = size or 0
+        old_path = block_paths[block_idx]
+        block_files[block_idx] = os.path.basename(path) if path else None
+        block_paths[block_idx] = path
+        nbytes = slot_read_size(block_idx)
+        if old_path and not any(
+            block_paths[i] == old_path and slot_read_size(i) == nbytes
+            for i in range(16)
+        ):
+            drop_prefetched(old_path, nbytes)
+        if path:
+            prefetch_file(path, nbytes)
+        block_status[block_idx] = None
+
+    def load_profile(name):
+        nonlocal profile, fingerprints
+        files, paths, known, status = load_selections(name)
+        if files is None:
+            files, paths, known, status = [None] * 16, [None] * 16, {}, [None] * 16
+        for i in range(16):
+            path = paths[i] if files[i] else None
+            # Sizes come from the fingerprints stat'ed while validating
+            set_block(i, path, known[path]["size"] if path in known else 0)
+            block_files[i] = files[i] if paths[i] else None
+        block_status[:] = status
+        fingerprints = known
+        profile = name
+
+    load_profile(profile)
 
     def curses_main(
         stdscr,
     ):
         curses.curs_set(0)  # Hide the cursor for the entire UI session
         nonlocal block_files, block_paths, slot_blocks
+        catalog = None  # Scanned on first use, then shared by every picker
         global APPLY_INT_KEYBOARD_PATCH, APPLY_BACKSLASH_PATCH
         addr_labels = [
             "0000H~3FFFH",
@@ -230,9 +1074,26 @@ def pick_files():
         color_333 = curses.color_pair(7)
         color_extras = curses.color_pair(9)
         selected_block = 0
+        save_error = None  # Shown on the bottom line until the next key
+
+        def try_save():
+            nonlocal save_error
+            if not persist:
+                return True
+            try:
+                save_selections(block_files, block_paths, profile, fingerprints)
+                return True
+            except OSError as e:
+                save_error = f"Could not save profile {profile}: {e}"
+                return False
+
         while True:
             stdscr.clear()
             stdscr.addstr(0, 0, "Omega MSX ROM Builder", curses.A_BOLD)
+            stdscr.addstr(0, 24, f"Profile: {profile} [F5]", curses.A_DIM)
+            stale = len([s for s in block_status if s])
+            if stale:
+                stdscr.addstr(f"  {stale} stale", curses.A_BOLD)
             # Get terminal size once per loop
             h, w = stdscr.getmaxyx()
             # Draw blocks and highlight selection
@@ -240,11 +1101,7 @@ def pick_files():
             total_kb = 0
             for i in range(16):
                 if block_files[i] and block_paths[i]:
-                    fpath = block_paths[i]
-                    try:
-                        fsize = os.path.getsize(fpath)
-                    except Exception:
-                        fsize = 0
+                    fsize = block_sizes[i]
                     blocks = max(
                         1,
                         min(
@@ -275,11 +1132,7 @@ def pick_files():
                 skip_blocks = 1
                 if block_files[block_idx] and block_paths[block_idx]:
                     fname = block_files[block_idx].lower()
-                    fpath = block_paths[block_idx]
-                    try:
-                        fsize = os.path.getsize(fpath)
-                    except Exception:
-                        fsize = 0
+                    fsize = block_sizes[block_idx]
                     blocks = max(1, min((fsize + 16 * 1024 - 1) // (16 * 1024), 4 - i))
                     skip_blocks = blocks
                     if "logo" in fname:
@@ -319,10 +1172,7 @@ def pick_files():
                     fname = block_files[block_idx].lower()
                     fname_lower = fname.lower()
                     fpath = block_paths[block_idx]
-                    try:
-                        fsize = os.path.getsize(fpath)
-                    except Exception:
-                        fsize = 0
+                    fsize = block_sizes[block_idx]
                     blocks = max(1, min((fsize + 16 * 1024 - 1) // (16 * 1024), 4 - i))
                     skip_blocks = blocks
                     if block_idx < 4:
@@ -408,11 +1258,7 @@ def pick_files():
                 skip_blocks = 1
                 if block_files[block_idx] and block_paths[block_idx]:
                     fname = block_files[block_idx].lower()
-                    fpath = block_paths[block_idx]
-                    try:
-                        fsize = os.path.getsize(fpath)
-                    except Exception:
-                        fsize = 0
+                    fsize = block_sizes[block_idx]
                     blocks = max(1, min((fsize + 16 * 1024 - 1) // (16 * 1024), 4 - i))
                     skip_blocks = blocks
                     if "disk" in fname:
@@ -452,11 +1298,7 @@ def pick_files():
                 skip_blocks = 1
                 if block_files[block_idx] and block_paths[block_idx]:
                     fname = block_files[block_idx].lower()
-                    fpath = block_paths[block_idx]
-                    try:
-                        fsize = os.path.getsize(fpath)
-                    except Exception:
-                        fsize = 0
+                    fsize = block_sizes[block_idx]
                     blocks = max(1, min((fsize + 16 * 1024 - 1) // (16 * 1024), 4 - i))
                     skip_blocks = blocks
                     if "kun" in fname or "music" in fname or "fm" in fname:
@@ -530,10 +1372,7 @@ def pick_files():
                     if block_files[i] and block_paths[i]:
                         fname = block_files[i]
                         fpath = block_paths[i]
-                        try:
-                            fsize = os.path.getsize(fpath)
-                        except Exception:
-                            fsize = 0
+                        fsize = block_sizes[i]
                         # Calculate how many blocks this file fills
                         blocks = max(
                             1,
@@ -582,6 +1421,8 @@ def pick_files():
                             label = f"{dirpart}/{fname}"
                         else:
                             label = fname
+                        if block_status[i]:
+                            label = f"{label} !{block_status[i]}"
                         slot_str = f"{slot_label:<8}"
                         block_str = f"block {block_start}"
                         if block_start != block_end:
@@ -605,15 +1446,28 @@ def pick_files():
                 stdscr.attron(curses.color_pair(1) | curses.A_BOLD)
                 stdscr.addstr(row, 2, total_line)
                 stdscr.attroff(curses.color_pair(1) | curses.A_BOLD)
+            if save_error:
+                stdscr.addstr(h - 1, 0, save_error[: w - 1], curses.color_pair(1))
             stdscr.refresh()
-            key = stdscr.getch()
+            key = read_key(stdscr)
+            failed_save, save_error = save_error, None
             if key in (27,):  # ESC
-                save_selections(block_files, block_paths)
-                return block_files, block_paths
+                # A second ESC after a failed save quits without saving
+                if failed_save or try_save():
+                    return block_files, block_paths
+                save_error += " - ESC again to quit without saving"
             elif key == curses.KEY_F2:
                 APPLY_INT_KEYBOARD_PATCH = not APPLY_INT_KEYBOARD_PATCH
             elif key == curses.KEY_F3:
                 APPLY_BACKSLASH_PATCH = not APPLY_BACKSLASH_PATCH
+            elif key == curses.KEY_F5:
+                # Save this profile and switch to the next saved one
+                if try_save():
+                    names = list_profiles()
+                    # Without persist the current profile may not be on disk yet
+                    current = names.index(profile) if profile in names else -1
+                    if names and names[(current + 1) % len(names)] != profile:
+                        load_profile(names[(current + 1) % len(names)])
             elif key in (curses.KEY_UP,):
                 if selected_block % 4 < 3:
                     selected_block += 1
@@ -628,91 +1482,448 @@ def pick_files():
                     selected_block += 4
             elif key in (curses.KEY_DC, 127):  # DEL or Backspace
                 if selected_block < 16:
-                    block_files[selected_block] = None
-                    block_paths[selected_block] = None
+                    set_block(selected_block, None)
             elif key in (ord("\n"), 10, 13):
-                if selected_block < 4:
-                    files = [
-                        f
-                        for f in list_all_files(["systemroms/machines"])
-                        if "bios" in os.path.basename(f).lower()
-                        or "logo" in os.path.basename(f).lower()
-                    ]
-                elif selected_block < 8:
-                    files = [
-                        f
-                        for f in list_all_files(["systemroms/machines", "extras"])
-                        if any(
-                            x in os.path.basename(f).lower()
-                            for x in ("sub", "kanji", "ext", "msxd")
-                        )
-                    ]
-                elif selected_block < 12:
-                    files = [
-                        f
-                        for f in list_all_files(["systemroms/machines"])
-                        if "disk" in os.path.basename(f).lower()
-                    ]
-                else:
-                    files = [
-                        f
-                        for f in list_all_files(["systemroms/machines"])
-                        if any(
-                            x in os.path.basename(f).lower()
-                            for x in ("kun", "fm", "music")
-                        )
-                    ]
+                if catalog is None:
+                    catalog = list_all_files([MACHINES_DIR, EXTRAS_DIR])
+                include, exclude = SLOT_FILTERS[selected_block // 4]
+                files = catalog.select(include, exclude)
                 pick = select_file(
                     stdscr,
+                    catalog,
                     files,
                     f"Block {selected_block%4+1} ({slot_blocks[selected_block][0]})",
+                    persist,
                 )
                 if pick is not None:
-                    block_files[selected_block] = os.path.basename(pick)
-                    block_paths[selected_block] = pick
+                    set_block(selected_block, pick)
         # else: ignore other keys
 
     return curses.wrapper(curses_main)
 
 
-def build_rom_image(selected_files, selected_paths, output_path):
+# --- Output Encoders ---
+# Encoders stream the image record by record through a bounded write buffer
+# and return the list of files they wrote.
+def _iter_records(rom, record_size):
+    # Yield (address, data) for every record that is not entirely 0xFF
+    view = memoryview(rom)
+    for addr in range(0, len(rom), record_size):
+        end = min(addr + record_size, len(rom))
+        if rom.count(0xFF, addr, end) != end - addr:
+            yield addr, view[addr:end]
+
+
+def write_raw(rom, output_path):
+    view = memoryview(rom)
+    with open(output_path, "wb", buffering=0) as f:
+        for addr in range(0, len(rom), OUTPUT_BUFFER_SIZE):
+            f.write(view[addr : addr + OUTPUT_BUFFER_SIZE])
+    return [output_path]
+
+
+def write_split_slots(rom, output_path):
+    # One 64KB binary per slot: <name>_slot0.bin, <name>_slot3-0.bin, ...
+    base, _ = os.path.splitext(output_path)
+    slot_size = BLOCK_SIZE * 4
+    view = memoryview(rom)
+    paths = []
+    for n, slot_name in enumerate(SLOT_NAMES):
+        path = f"{base}_{slot_name}.bin"
+        write_raw(view[n * slot_size : (n + 1) * slot_size], path)
+        paths.append(path)
+    return paths
+
+
+def _intel_hex_line(rtype, addr, data):
+    record = bytearray([len(data), (addr >> 8) & 0xFF, addr & 0xFF, rtype])
+    record += data
+    record.append(-sum(record) & 0xFF)
+    return f":{record.hex().upper()}\n"
+
+
+def write_intel_hex(rom, output_path):
+    # Addresses above 64KB use Extended Linear Address (type 04) records
+    upper = 0
+    with open(output_path, "w", encoding="ascii", buffering=OUTPUT_BUFFER_SIZE) as f:
+        for addr, data in _iter_records(rom, RECORD_SIZE):
+            if addr >> 16 != upper:
+                upper = addr >> 16
+                f.write(_intel_hex_line(0x04, 0, upper.to_bytes(2, "big")))
+            f.write(_intel_hex_line(0x00, addr & 0xFFFF, data))
+        f.write(_intel_hex_line(0x01, 0, b""))
+    return [output_path]
+
+
+def _srec_line(rtype, addr, addr_len, data):
+    record = bytearray([addr_len + len(data) + 1])
+    record += addr.to_bytes(addr_len, "big")
+    record += data
+    record.append(~sum(record) & 0xFF)
+    return f"S{rtype}{record.hex().upper()}\n"
+
+
+def write_srec(rom, output_path):
+    # 256KB needs 24-bit addresses: S0 header, S2 data, S8 termination
+    header = os.path.basename(output_path).encode("ascii", "replace")[:32]
+    with open(output_path, "w", encoding="ascii", buffering=OUTPUT_BUFFER_SIZE) as f:
+        f.write(_srec_line(0, 0, 2, header))
+        for addr, data in _iter_records(rom, RECORD_SIZE):
+            f.write(_srec_line(2, addr, 3, data))
+        f.write(_srec_line(8, 0, 3, b""))
+    return [output_path]
+
+
+# Format name -> (encoder, file extension)
+OUTPUT_ENCODERS = {
+    "bin": (write_raw, ".bin"),
+    "hex": (write_intel_hex, ".hex"),
+    "srec": (write_srec, ".s28"),
+    "split": (write_split_slots, ".bin"),
+}
+
+
+def build_rom_image(selected_files, selected_paths, output_path, formats=None):
     # Build a 256KB ROM image from selected files, filling unused blocks with 0xFF
     rom = bytearray([0xFF] * (BLOCK_SIZE * MAX_BLOCKS))
-    for i, (fname, fpath) in enumerate(zip(selected_files, selected_paths)):
-        if fname and fpath:
-            try:
-                with open(fpath, "rb") as f:
-                    data = f.read(BLOCK_SIZE * (4 - (i % 4)))
-                offset = i * BLOCK_SIZE
-                rom[offset : offset + len(data)] = data
-            except Exception as e:
-                print(f"Error reading {fpath}: {e}")
-    # Apply patches if enabled
+    blocks = [
+        (i, (fpath, slot_read_size(i)))
+        for i, (fname, fpath) in enumerate(zip(selected_files, selected_paths))
+        if fname and fpath
+    ]
+    # Patches enabled: (file, offset). Example offsets as in your shell script
+    patches = []
     if APPLY_INT_KEYBOARD_PATCH:
-        try:
-            with open("patches/int_keys_patch.bin", "rb") as f:
-                patch = f.read()
-            # Example offset: 3529 (as in your shell script)
-            rom[3529 : 3529 + len(patch)] = patch
-            print("Applied int_keys_patch.bin at offset 3529")
-        except Exception as e:
-            print(f"Could not apply int_keys_patch: {e}")
+        patches.append((INT_KEYBOARD_PATCH_FILE, 3529))
     if APPLY_BACKSLASH_PATCH:
-        try:
-            with open("patches/backslash_patch.bin", "rb") as f:
-                patch = f.read()
-            # Example offset: 7839 (as in your shell script)
-            rom[7839 : 7839 + len(patch)] = patch
-            print("Applied backslash_patch.bin at offset 7839")
-        except Exception as e:
-            print(f"Could not apply backslash_patch: {e}")
-    with open(output_path, "wb") as f:
-        f.write(rom)
-    print(f"ROM image written to {output_path}")
+        patches.append((BACKSLASH_PATCH_FILE, 7839))
+    # All files are read concurrently; a missing block fails the build
+    # instead of silently staying 0xFF
+    results = read_many([key for _, key in blocks] + [(p, None) for p, _ in patches])
+    errors = []
+    for (i, _), data in zip(blocks, results):
+        if isinstance(data, FileAccessError):
+            errors.append(data)
+            continue
+        offset = i * BLOCK_SIZE
+        rom[offset : offset + len(data)] = data
+    if errors:
+        raise RomBuildError(errors)
+    for (patch_file, offset), patch in zip(patches, results[len(blocks) :]):
+        patch_name = os.path.basename(patch_file)
+        if isinstance(patch, FileAccessError):
+            print(f"Could not apply {patch_name}: {patch}")
+            continue
+        rom[offset : offset + len(patch)] = patch
+        print(f"Applied {patch_name} at offset {offset}")
+    for fmt in formats if formats is not None else OUTPUT_FORMATS:
+        encoder, ext = OUTPUT_ENCODERS[fmt]
+        for path in encoder(rom, os.path.splitext(output_path)[0] + ext):
+            print(f"ROM image written to {path}")
+
+
+# --- Key Record / Replay ---
+# All UI input goes through read_key, so a session's keystrokes can be
+# recorded and later replayed against a virtual screen without a terminal.
+_recorded_keys = None  # [key, seconds since previous key] while recording
+_last_key_time = None
+
+
+class ReplayFinished(Exception):
+    pass
+
+
+def read_key(win):
+    global _last_key_time
+    key = win.getch()
+    if _recorded_keys is not None:
+        now = time.time()
+        delay = now - _last_key_time if _last_key_time is not None else 0.0
+        _recorded_keys.append([key, round(delay, 3)])
+        _last_key_time = now
+    return key
+
+
+def start_recording():
+    global _recorded_keys, _last_key_time
+    _recorded_keys = []
+    _last_key_time = None
+
+
+def save_recording(path, lines, cols):
+    _write_json_atomic(
+        path, {"version": 1, "lines": lines, "cols": cols, "keys": _recorded_keys}
+    )
+
+
+class KeyReplay:
+    # Feeds recorded keys to the UI and measures the time spent handling each
+    # key, from getch returning it to the next getch call.
+
+    def __init__(self, keys, lines=24, cols=80):
+        self.keys = keys
+        self.lines = lines
+        self.cols = cols
+        self.pos = 0
+        self.latencies = []
+        self.cells = 0
+        self.refreshes = 0
+        self._handed_out = None
+
+    def next_key(self):
+        now = time.perf_counter()
+        if self._handed_out is not None:
+            self.latencies.append(now - self._handed_out)
+        if self.pos >= len(self.keys):
+            raise ReplayFinished()
+        key = self.keys[self.pos]
+        self.pos += 1
+        self._handed_out = time.perf_counter()
+        return key
+
+    def finish(self):
+        # The last key (e.g. ESC) ends the UI without another getch call
+        if len(self.latencies) < self.pos:
+            self.latencies.append(time.perf_counter() - self._handed_out)
+
+
+class VirtualWindow:
+    # Stand-in for a curses window that only counts the cells written
+
+    def __init__(self, replay, height, width):
+        self.replay = replay
+        self.height = height
+        self.width = width
+
+    def getmaxyx(self):
+        return self.height, self.width
+
+    def addstr(self, *args):
+        if isinstance(args[0], str):
+            text = args[0]
+        else:
+            y, x, text = args[:3]
+            if not (0 <= y < self.height and 0 <= x < self.width):
+                raise curses.error("addwstr() returned ERR")
+        self.replay.cells += len(text)
+
+    def box(self):
+        self.replay.cells += 2 * (self.height + self.width) - 4
+
+    def refresh(self):
+        self.replay.refreshes += 1
+
+    def getch(self):
+        return self.replay.next_key()
+
+    def keypad(self, flag):
+        pass
+
+    def clear(self):
+        pass
+
+    def attron(self, attr):
+        pass
+
+    def attroff(self, attr):
+        pass
+
+
+class HeadlessCurses:
+    # Replaces the curses module during replay; constants such as KEY_UP and
+    # A_BOLD still come from the real module
+
+    def __init__(self, real, replay):
+        self._real = real
+        self._replay = replay
+        self.COLORS = 256
+
+    def __getattr__(self, name):
+        return getattr(self._real, name)
+
+    def wrapper(self, func, *args):
+        replay = self._replay
+        return func(VirtualWindow(replay, replay.lines, replay.cols), *args)
+
+    def newwin(self, height, width, y=0, x=0):
+        return VirtualWindow(self._replay, height, width)
+
+    def color_pair(self, n):
+        return n << 8
+
+    def curs_set(self, visibility):
+        pass
+
+    def start_color(self):
+        pass
+
+    def use_default_colors(self):
+        pass
+
+    def init_pair(self, pair, fg, bg):
+        pass
+
+
+def _percentile(sorted_values, pct):
+    # Nearest-rank percentile
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def replay_session(path, profile=DEFAULT_PROFILE):
+    # Run a recorded session headlessly and return its latency report
+    global curses
+    with open(path, "r") as f:
+        data = json.load(f)
+    replay = KeyReplay(
+        [key for key, _ in data["keys"]], data.get("lines", 24), data.get("cols", 80)
+    )
+    real = curses
+    curses = HeadlessCurses(real, replay)
+    try:
+        pick_files(profile, persist=False)
+    except ReplayFinished:
+        pass
+    finally:
+        curses = real
+    replay.finish()
+    latencies = sorted(replay.latencies)
+    keys = len(latencies)
+    return {
+        "keys": keys,
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p90_ms": _percentile(latencies, 90) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        "max_ms": (latencies[-1] if latencies else 0.0) * 1000,
+        "cells": replay.cells,
+        "cells_per_key": replay.cells / keys if keys else 0.0,
+        "refreshes": replay.refreshes,
+    }
+
+
+def benchmark_io(dirs, workers):
+    # Time a library scan plus reading one block from up to 64 of its files,
+    # first with a single I/O worker and then with the given number. Returns
+    # (workers, files, blocks read, seconds, errors) per run.
+    results = []
+    for n in (1, workers):
+        set_io_workers(n)
+        start = time.perf_counter()
+        catalog = list_all_files(dirs)
+        count = min(len(catalog), 64)
+        reads = read_many([(catalog.path(i), BLOCK_SIZE) for i in range(count)])
+        elapsed = time.perf_counter() - start
+        errors = catalog.errors + [r for r in reads if isinstance(r, FileAccessError)]
+        results.append((n, len(catalog), count, elapsed, errors))
+    return results
 
 
 def main():
-    selected_files, selected_paths = pick_files()
+    parser = argparse.ArgumentParser(description="Omega MSX ROM Builder")
+    parser.add_argument(
+        "profile",
+        nargs="?",
+        default=DEFAULT_PROFILE,
+        help=f"selection profile to load and save (default: {DEFAULT_PROFILE})",
+    )
+    parser.add_argument(
+        "--list-profiles", action="store_true", help="list saved profiles and exit"
+    )
+    parser.add_argument(
+        "--format",
+        action="append",
+        choices=sorted(OUTPUT_ENCODERS),
+        help="output format, may be repeated (default: "
+        f"{', '.join(OUTPUT_FORMATS)})",
+    )
+    keys = parser.add_mutually_exclusive_group()
+    keys.add_argument("--record", metavar="FILE", help="record keystrokes to FILE")
+    keys.add_argument(
+        "--replay",
+        metavar="FILE",
+        help="replay keystrokes from FILE headlessly and report UI latency",
+    )
+    parser.add_argument(
+        "--max-p99",
+        type=float,
+        metavar="MS",
+        help="with --replay, exit with status 1 if p99 latency exceeds MS",
+    )
+    parser.add_argument(
+        "--io-workers",
+        type=int,
+        default=IO_WORKERS,
+        metavar="N",
+        help=f"concurrent file operations (default: {IO_WORKERS})",
+    )
+    parser.add_argument(
+        "--io-latency",
+        type=float,
+        metavar="MS",
+        help="simulate MS of storage latency on every file operation",
+    )
+    parser.add_argument(
+        "--io-fail-rate",
+        type=float,
+        default=0.0,
+        metavar="P",
+        help="with --io-latency, fail each file operation with probability P",
+    )
+    parser.add_argument(
+        "--bench-io",
+        action="store_true",
+        help="time a library scan with 1 and --io-workers workers and exit",
+    )
+    args = parser.parse_args()
+    global io_fs
+    set_io_workers(max(1, args.io_workers))
+    if args.io_latency is not None:
+        io_fs = LatencyFS(args.io_latency / 1000, failure_rate=args.io_fail_rate)
+    if args.bench_io:
+        for workers, files, reads, elapsed, errors in benchmark_io(
+            [MACHINES_DIR, EXTRAS_DIR], IO_WORKERS
+        ):
+            print(
+                f"{workers:3d} worker(s): scanned {files} files, "
+                f"read {reads} blocks in {elapsed:.2f} s"
+            )
+            if errors:
+                print(f"    {len(errors)} unreadable, first: {errors[0]}")
+        return
+    if args.list_profiles:
+        for name in list_profiles():
+            print(name)
+        return
+    if not args.profile or os.sep in args.profile or args.profile.startswith("."):
+        parser.error(f"invalid profile name: {args.profile!r}")
+    if args.replay:
+        report = replay_session(args.replay, args.profile)
+        print(
+            f"{report['keys']} keys  "
+            f"p50 {report['p50_ms']:.2f} ms  "
+            f"p90 {report['p90_ms']:.2f} ms  "
+            f"p99 {report['p99_ms']:.2f} ms  "
+            f"max {report['max_ms']:.2f} ms"
+        )
+        print(
+            f"{report['cells']} cells written "
+            f"({report['cells_per_key']:.0f} per key, "
+            f"{report['refreshes']} refreshes)"
+        )
+        if args.max_p99 is not None and report["p99_ms"] > args.max_p99:
+            sys.exit(1)
+        return
+    if args.record:
+        start_recording()
+    selected_files, selected_paths = pick_files(args.profile)
+    if args.record:
+        try:
+            save_recording(args.record, curses.LINES, curses.COLS)
+            print(f"Recorded {len(_recorded_keys)} keys to {args.record}")
+        except OSError as e:
+            print(f"Could not save recording to {args.record}: {e}")
     print("\nSelected files:")
 
     # Define color codes for terminal output
@@ -727,15 +1938,13 @@ def main():
         "KUN_MUSIC": "\033[38;5;231m\033[48;5;39m",  # white on deep sky blue
     }
 
+    stats = stat_many(p for p in selected_paths if p)
     i = 0
     while i < 16:
         if selected_files[i] and selected_paths[i]:
             fname = selected_files[i]
             fpath = selected_paths[i]
-            try:
-                fsize = os.path.getsize(fpath)
-            except Exception:
-                fsize = 0
+            fsize = stats[fpath].st_size if stats[fpath] else 0
 
             # Calculate how many blocks this file fills
             blocks = max(
@@ -794,7 +2003,14 @@ def main():
 
     # Build ROM image with patch options
     output_path = "omega_output.bin"
-    build_rom_image(selected_files, selected_paths, output_path)
+    try:
+        formats = list(dict.fromkeys(args.format)) if args.format else None
+        build_rom_image(selected_files, selected_paths, output_path, formats)
+    except RomBuildError as e:
+        print(f"\nROM image not written: {e}")
+        for error in e.errors:
+            print(f"  {error}")
+        sys.exit(1)
 
 
 if __name__ == "__main__":